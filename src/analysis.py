@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import ast
+
+
+# Bit assigned to each AST node type, used in subtree type summaries
+TYPE_BITS = {}
+
+
+def type_bit(node_type):
+    bit = TYPE_BITS.get(node_type)
+
+    if bit is None:
+        bit = TYPE_BITS[node_type] = 1 << len(TYPE_BITS)
+
+    return bit
+
+
+def types_mask(types):
+    mask = 0
+
+    for node_type in types:
+        mask |= type_bit(node_type)
+
+    return mask
+
+
+# Structural facts about a parsed file shared by all visitors running on it. Each
+# fact is computed for the whole tree on first request and cached afterwards.
+class Analysis:
+    TYPES_SCOPE = (ast.AsyncFunctionDef, ast.ClassDef, ast.FunctionDef)
+
+    def __init__(self, tree):
+        self.tree = tree
+        self._parents = None
+        self._scopes = None
+        self._subtree_types = None
+
+    def contains(self, node, types):
+        return bool(self.subtree_types[node] & types_mask(types))
+
+    def get_parent(self, node):
+        return self.parents.get(node)
+
+    def get_scope(self, node):
+        return self.scopes.get(node)
+
+    @property
+    def parents(self):
+        if self._parents is None:
+            self._parents = {}
+
+            for node in ast.walk(self.tree):
+                for child in ast.iter_child_nodes(node):
+                    self._parents[child] = node
+
+        return self._parents
+
+    @property
+    def scopes(self):
+        # Closest enclosing function or class of each node
+        if self._scopes is None:
+            self._scopes = {}
+            stack = [(self.tree, None)]
+
+            while stack:
+                node, scope = stack.pop()
+                self._scopes[node] = scope
+
+                if isinstance(node, self.TYPES_SCOPE):
+                    scope = node
+
+                stack.extend([(child, scope) for child in ast.iter_child_nodes(node)])
+
+        return self._scopes
+
+    @property
+    def subtree_types(self):
+        # Bitset of node types present in subtree of each node (node included)
+        if self._subtree_types is None:
+            self._subtree_types = {}
+            self.summarize(self.tree)
+
+        return self._subtree_types
+
+    def summarize(self, node):
+        mask = TYPE_BITS.get(type(node)) or type_bit(type(node))
+
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        mask |= self.summarize(item)
+            elif isinstance(value, ast.AST):
+                mask |= self.summarize(value)
+
+        self._subtree_types[node] = mask
+        return mask
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import ast
+import hashlib
+import os
+
+
+# Stable finding fingerprint. Line numbers are not included so fingerprints
+# survive unrelated changes which only shift code around in the file.
+def fingerprint(finding, occurrence=0):
+    parts = [
+        finding["filename"],
+        finding["visitor"],
+        ".".join(finding["fn"]),
+        "->".join(finding["cf"]),
+        str(finding["msg"]),
+        finding["node_hash"],
+        str(occurrence),
+    ]
+
+    return hashlib.sha1("\0".join(parts).encode("utf-8", "backslashreplace")).hexdigest()
+
+
+# Hash of the node type, its scalar fields and types of its child nodes. Child
+# subtrees and bodies are not included, so edits inside a reported class or function
+# don't change fingerprints of its findings.
+def node_hash(node):
+    if node is None:
+        return ""
+
+    parts = [type(node).__name__]
+
+    for name, value in ast.iter_fields(node):
+        if isinstance(value, ast.AST):
+            parts.append(f"{name}={type(value).__name__}")
+        elif isinstance(value, list):
+            if not any([isinstance(x, ast.AST) for x in value]):
+                parts.append(f"{name}={value!r}")
+        else:
+            parts.append(f"{name}={value!r}")
+
+    return hashlib.sha1("\0".join(parts).encode("utf-8", "backslashreplace")).hexdigest()
+
+
+# Set of accepted findings which are not reported again. In update mode all
+# findings of the current run are streamed into a new baseline file.
+class Baseline:
+    HEADER = "# astvuln baseline v1"
+
+    def __init__(self, log, path, update=False, resume=False):
+        self.fingerprints = set()
+        self.log = log
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.writer = None
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    for line in f:
+                        if line.startswith("#") or not line.strip():
+                            continue
+
+                        self.fingerprints.add(bytes.fromhex(line[:40]))
+            except (OSError, ValueError) as e:
+                self.log.error(f'Error reading baseline "{path}": {e}')
+        elif not update:
+            self.log.error(f"Baseline does not exist: {path}")
+
+        if update:
+            # Resumed scan continues writing baseline of the interrupted scan
+            resume = resume and os.path.exists(self.tmp_path)
+
+            try:
+                self.writer = open(self.tmp_path, "a" if resume else "w")
+            except OSError as e:
+                self.log.error(f'Error writing baseline "{self.tmp_path}": {e}')
+
+            if not resume:
+                self.writer.write(self.HEADER + "\n")
+
+    def __contains__(self, fp):
+        return bytes.fromhex(fp) in self.fingerprints
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def add(self, fp, finding):
+        if self.writer:
+            msg = str(finding["msg"]).replace("\n", " ")
+            self.writer.write(f'{fp} {finding["filename"]}:{finding["line_start"]} {finding["visitor"]} {msg}\n')
+
+    def flush(self):
+        if self.writer:
+            self.writer.flush()
+
+    def close(self, commit=True, keep=False):
+        if not self.writer:
+            return
+
+        self.writer.close()
+        self.writer = None
+
+        if commit:
+            os.replace(self.tmp_path, self.path)
+        elif not keep:
+            os.remove(self.tmp_path)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import json
+import os
+import time
+
+from .common import decode_data, encode_data
+
+
+# Position of path in sorted walk order (files of a directory before its subdirectories)
+def walk_key(path):
+    parts = path.split(os.sep)
+    return [(1, x) for x in parts[:-1]] + [(0, parts[-1])]
+
+
+# Scan progress saved periodically to a state file so that an interrupted scan can
+# be resumed. Progress is the phase and the last completed file in (sorted) walk
+# order. Files before it are skipped on resume unless they were modified after the
+# scan started. Fingerprints of reported findings are appended to a journal, so
+# findings of files scanned again after resume are not reported twice.
+class Checkpoint:
+    INTERVAL = 30  # Seconds between checkpoints
+    VERSION = 2
+
+    def __init__(self, log, path, job, resume=False):
+        self.emitted = set()
+        self.job = job
+        self.journal_path = f"{path}.journal"
+        self.last = time.monotonic()
+        self.log = log
+        self.path = path
+        self.started = time.time()
+        self.state = None
+
+        if resume:
+            try:
+                with open(path, "r") as f:
+                    self.state = json.load(f)
+                with open(self.journal_path, "r") as f:
+                    self.emitted = set([line.strip() for line in f if line.strip()])
+            except (OSError, ValueError) as e:
+                self.log.error(f'Error reading checkpoint "{path}": {e}')
+
+            if self.state.get("version") != self.VERSION or self.state.get("job") != job:
+                self.log.error("Checkpoint was created for a different scan")
+
+            self.started = self.state["started"]
+
+        self.journal = open(self.journal_path, "a" if resume else "w", buffering=1)
+
+    def finish(self, scanner, completed=True):
+        if not completed:
+            # Interrupted file is scanned again, keep findings reported from it
+            self.save(scanner, force=True, truncate=False)
+
+        self.journal.close()
+
+        if completed:
+            for path in [self.path, self.journal_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def record(self, fp):
+        self.journal.write(fp + "\n")
+
+    def remaining(self, root, paths, last):
+        # Paths after the last completed one and completed paths changed since start
+        last_key = walk_key(last)
+
+        for path in paths:
+            if walk_key(os.path.relpath(path, root)) > last_key:
+                yield path
+                continue
+
+            try:
+                if os.stat(path).st_mtime >= self.started:
+                    yield path
+            except OSError:
+                yield path  # Let scanner report the error
+
+    def restore(self, scanner):
+        # Returns phase and last completed file to continue from
+        if self.state is None:
+            return None, None
+
+        scanner.completed = {key: self.state[key] for key in scanner.completed}
+        for key, value in scanner.completed.items():
+            setattr(scanner, key, value)
+        scanner.data.update(decode_data(self.state["data"]))
+
+        return self.state["phase"], self.state["last"]
+
+    def save(self, scanner, force=False, truncate=True):
+        now = time.monotonic()
+
+        if not force and now - self.last < self.INTERVAL:
+            return
+
+        state = {
+            "version": self.VERSION,
+            "job": self.job,
+            "started": self.started,
+            "phase": scanner.phase,
+            "last": scanner.last,
+            **scanner.completed,  # Counters after last completed file
+            "data": encode_data(scanner.data),
+        }
+
+        # Baseline entries of completed files need to be stored before checkpoint
+        if scanner.baseline is not None:
+            scanner.baseline.flush()
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+        # Only completed files were reported since checkpoint, they are never scanned
+        # again. Findings from journal of resumed scan are kept until the scan ends.
+        if truncate:
+            self.journal.close()
+            self.journal = open(self.journal_path, "w", buffering=1)
+            self.journal.writelines([x + "\n" for x in self.emitted])
+
+        self.last = now
@@ -4,8 +4,12 @@
 # This code is licensed under the MIT license. See LICENSE.md for license terms.
 
 import datetime
+import os
 import sys
 
+# Directory for caches shared between runs (registry manifest, flattened trees)
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "astvuln")
+
 
 # Colors
 class Colors:
@@ -50,3 +54,44 @@ class Log:
 
     def plain(self, msg, clr=None):
         print(f"{clr}{msg}{self.clr.NONE}" if clr else msg, file=sys.stderr)
+
+
+# Helper functions for storing scanner data as JSON (sets are stored sorted)
+def encode_data(value):
+    if isinstance(value, (set, frozenset)):
+        return {"__set__": sorted([encode_data(x) for x in value], key=repr)}
+    elif isinstance(value, dict):
+        return {key: encode_data(x) for key, x in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [encode_data(x) for x in value]
+
+    return value
+
+
+def decode_data(value):
+    if isinstance(value, dict):
+        if list(value.keys()) == ["__set__"]:
+            return set([decode_data(x) for x in value["__set__"]])
+        return {key: decode_data(x) for key, x in value.items()}
+    elif isinstance(value, list):
+        return [decode_data(x) for x in value]
+
+    return value
+
+
+def merge_data(target, source):
+    for key, value in source.items():
+        if key not in target:
+            target[key] = value
+        elif isinstance(value, set):
+            target[key] |= value
+        elif isinstance(value, dict):
+            target[key].update(value)
+        elif isinstance(value, list):
+            target[key].extend(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            target[key] += value
+        else:
+            target[key] = value
+
+    return target
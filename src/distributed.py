@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from .common import decode_data, encode_data, merge_data
+from .scanner import Scanner
+
+
+# Sharded scans use a work directory as a queue shared by coordinator and workers:
+#   job.json     Methods and options of the scan
+#   todo/        Shards waiting for a worker
+#   claimed/     Shards being processed (moved from todo/ by a worker, which renews
+#                its lease by touching the file until the shard is done)
+#   results/     Partial results of processed shards
+#   data.json    Previsitor data merged after the previsit phase
+#   done         Created by coordinator when there is no more work
+JOB = "job.json"
+LEASE = 60  # Seconds after which shards of unresponsive workers are queued again
+POLL_INTERVAL = 0.1
+
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    # Write to temporary file first so readers never see partial files
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+# Scanner collecting findings of a shard instead of printing them
+class ShardScanner(Scanner):
+    def __init__(self, log, **kwargs):
+        super().__init__(log, **kwargs)
+        self.captured = []
+
+    def print_result(self, state, msg, print_source=True, print_state=True, visitor=None):
+        finding = self.get_finding(state, msg, visitor)
+        finding["fingerprint"] = self.get_fingerprint(finding)
+        finding["msg"] = str(msg)
+        finding["path"] = self.state["filename"]
+        finding["index"] = len(self.captured)
+        finding["print_state"] = print_state
+        finding["source"] = self.get_source(state) if print_source and self.print_source else None
+        self.captured.append(finding)
+
+    def scan_shard(self, shard, data):
+        merge_data(self.data, data)
+
+        if shard["phase"] == "previsit":
+            self.scan_paths(shard["files"], self.previsitors)
+            return {"files": self.n_files, "findings": [], "data": encode_data(self.data)}
+
+        self.scan_paths(shard["files"], self.visitors)
+        return {"files": self.n_files, "findings": self.captured, "data": {}}
+
+
+# Worker processing shards from work directory until coordinator is done
+class Worker:
+    def __init__(self, log, workdir, scanner_factory):
+        self.id = f"{socket.gethostname()}-{os.getpid()}"
+        self.log = log
+        self.n_shards = 0
+        self.scanner_factory = scanner_factory
+        self.workdir = workdir
+
+    def claim(self):
+        todo = os.path.join(self.workdir, "todo")
+
+        for name in sorted(os.listdir(todo)):
+            claimed = os.path.join(self.workdir, "claimed", f"{name}.{self.id}")
+            try:
+                os.rename(os.path.join(todo, name), claimed)
+                os.utime(claimed)  # Start lease, rename keeps time of queueing
+                return name, claimed
+            except FileNotFoundError:
+                continue  # Claimed by another worker or re-queued
+
+        return None, None
+
+    def heartbeat(self, claimed, stop):
+        while not stop.wait(LEASE / 4):
+            try:
+                os.utime(claimed)
+            except OSError:
+                return  # Lease expired and shard was queued again
+
+    def run(self):
+        job = read_json(os.path.join(self.workdir, JOB))
+        os.chdir(job["cwd"])  # Paths in shards are relative to coordinator
+
+        # Coordinator is done when all shards are processed or when the scan failed
+        while not os.path.exists(os.path.join(self.workdir, "done")):
+            name, claimed = self.claim()
+
+            if name is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            stop = threading.Event()
+            threading.Thread(target=self.heartbeat, args=(claimed, stop), daemon=True).start()
+            scanner = None
+
+            try:
+                data_path = os.path.join(self.workdir, "data.json")
+                data = decode_data(read_json(data_path)) if os.path.exists(data_path) else {}
+                scanner = self.scanner_factory()
+                scanner.root = job["root"]
+                result = scanner.scan_shard(read_json(claimed), data)
+            except Exception as e:
+                # Failed shard is reported to coordinator instead of staying claimed
+                state = getattr(scanner, "state", None)
+                where = f' in "{state["filename"]}"' if state else ""
+                result = {"error": f"{type(e).__name__}{where}: {e}", "worker": self.id}
+                self.log.info(f"Shard {name} failed{where}: {e}")
+            finally:
+                stop.set()
+
+            write_json(os.path.join(self.workdir, "results", name), result)
+            self.n_shards += 1
+
+            try:
+                os.remove(claimed)
+            except FileNotFoundError:
+                pass  # Lease expired and shard was queued again
+
+
+# Coordinator splitting scan into shards, waiting for workers and merging results
+# into a single report. Files are assigned to shards by hash of their path relative
+# to the scanned directory or by hash of their top-level directory (repository).
+class Coordinator(Scanner):
+    def __init__(self, log, workdir, methods, rules=[], shards=16, by_repository=False, jobs=0, **kwargs):
+        super().__init__(log, **kwargs)
+        self.by_repository = by_repository
+        self.jobs = jobs
+        self.methods = methods
+        self.n_shards = max(shards, 1)
+        self.processes = []
+        self.rules = rules
+        self.workdir = os.path.abspath(workdir)
+
+    def check_workers(self):
+        codes = [x.poll() for x in self.processes]
+
+        for code in codes:
+            if code:
+                self.log.error(f"Worker exited with code {code} before all shards were processed")
+
+        if codes and all([x is not None for x in codes]):
+            self.log.error("Workers exited before all shards were processed")
+
+    def get_shard(self, path):
+        key = os.path.relpath(path, self.root)
+
+        if self.by_repository:
+            key = key.split(os.sep, 1)[0]
+
+        return int(hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()[:8], 16) % self.n_shards
+
+    def prepare(self):
+        for name in ["todo", "claimed", "results"]:
+            path = os.path.join(self.workdir, name)
+            os.makedirs(path, exist_ok=True)
+
+            for filename in os.listdir(path):
+                os.remove(os.path.join(path, filename))
+
+        for name in ["data.json", "done"]:
+            if os.path.exists(os.path.join(self.workdir, name)):
+                os.remove(os.path.join(self.workdir, name))
+
+        write_json(
+            os.path.join(self.workdir, JOB),
+            {
+                "cwd": os.getcwd(),
+                "root": self.root,
+                "methods": self.methods,
+                "rules": self.rules,
+                "flat": self.flat,
+                "print_source": self.print_source,
+            },
+        )
+
+    def print_results(self, results):
+        findings = []
+
+        for result in results:
+            self.n_files += result["files"]
+            findings += result["findings"]
+
+        # Sort by file and by order in which findings were reported in the file
+        for finding in sorted(findings, key=lambda x: (x["path"], x["index"])):
+            if self.baseline is not None:
+                self.baseline.add(finding["fingerprint"], finding)
+
+                if finding["fingerprint"] in self.baseline:
+                    self.n_suppressed += 1
+                    continue
+
+            self.print_finding(
+                finding["path"],
+                finding["line_start"],
+                finding["fn"] if finding["print_state"] else [],
+                finding["cf"] if finding["print_state"] else [],
+                finding["msg"],
+                finding["source"],
+            )
+
+    def requeue(self):
+        # Shards of workers which stopped renewing their lease are queued again
+        claimed = os.path.join(self.workdir, "claimed")
+
+        for filename in os.listdir(claimed):
+            path = os.path.join(claimed, filename)
+            name = filename[: filename.index(".json") + 5]
+
+            try:
+                if time.time() - os.stat(path).st_mtime > LEASE:
+                    os.rename(path, os.path.join(self.workdir, "todo", name))
+                    self.log.info(f"Lease of shard {name} expired, queued again")
+            except FileNotFoundError:
+                continue  # Completed in the meantime
+
+    def run_phase(self, phase, path):
+        shards = {}
+
+        for file_path in [path] if os.path.isfile(path) else self.iter_paths(path):
+            shards.setdefault(self.get_shard(file_path), []).append(file_path)
+
+        for shard, files in shards.items():
+            name = f"{phase}-{shard:05}.json"
+            write_json(os.path.join(self.workdir, "todo", name), {"phase": phase, "shard": shard, "files": files})
+
+        self.log.info(f"Waiting for {len(shards)} {phase} shards")
+        names = [f"{phase}-{shard:05}.json" for shard in sorted(shards.keys())]
+        results = {}
+
+        while len(results) < len(names):
+            for name in names:
+                path = os.path.join(self.workdir, "results", name)
+
+                if name not in results and os.path.exists(path):
+                    results[name] = read_json(path)
+
+                    result = results[name]
+                    if "error" in result:
+                        self.log.error(f'Shard {name} failed on worker {result["worker"]}: {result["error"]}')
+
+            if len(results) < len(names):
+                self.check_workers()
+                self.requeue()
+                time.sleep(POLL_INTERVAL)
+
+        return [results[x] for x in names]
+
+    def scan(self, path):
+        if not os.path.exists(path):
+            self.log.error(f"Path does not exist: {path}")
+
+        self.root = path if os.path.isdir(path) else os.path.dirname(path)
+        self.prepare()
+
+        # Local workers are started with the same interpreter and script
+        for _ in range(self.jobs):
+            args = [sys.executable, sys.argv[0], "-W", self.workdir]
+            args += ["-c"] if self.log.clr.no_colors else []
+            self.processes.append(subprocess.Popen(args))
+
+        try:
+            if self.previsitors:
+                data = {}
+                for result in self.run_phase("previsit", path):
+                    self.n_files += result["files"]  # Counted in both phases as in a normal scan
+                    merge_data(data, decode_data(result["data"]))
+                write_json(os.path.join(self.workdir, "data.json"), encode_data(data))
+
+            results = self.run_phase("scan", path)
+        finally:
+            open(os.path.join(self.workdir, "done"), "w").close()
+
+            for process in self.processes:
+                process.wait()
+
+        self.print_results(results)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import array
+import ast
+import hashlib
+import marshal
+import os
+import sys
+
+from .common import CACHE_DIR
+
+numpy = False  # Imported on first query, see get_numpy
+
+
+# Use numpy for vectorized queries if available or fallback to plain loops. Import
+# is slow, so it's done only when flattened trees are queried.
+def get_numpy():
+    global numpy
+
+    if numpy is False:
+        try:
+            import numpy
+        except Exception:
+            numpy = None
+
+    return numpy
+
+
+# Code assigned to each AST node type, stable for a Python version as codes are cached
+TYPES = sorted(
+    [x for x in vars(ast).values() if isinstance(x, type) and issubclass(x, ast.AST)], key=lambda x: x.__name__
+)
+TYPE_CODES = {x: ii for ii, x in enumerate(TYPES)}
+
+
+def type_code(node_type):
+    code = TYPE_CODES.get(node_type)
+
+    if code is None:
+        code = TYPE_CODES[node_type] = len(TYPES)
+        TYPES.append(node_type)
+
+    return code
+
+
+# Fields interned as node values, calls are interned by the called name
+VALUE_FIELDS = {
+    ast.AsyncFunctionDef: "name",
+    ast.ClassDef: "name",
+    ast.Constant: "value",
+    ast.FunctionDef: "name",
+    ast.Name: "id",
+    ast.arg: "arg",
+}
+
+
+def call_name(node):
+    node = node.func
+
+    if type(node) is ast.Name:
+        return node.id
+    elif type(node) is ast.Attribute:
+        return node.attr
+
+    return None
+
+
+# Child nodes in visiting order, expression contexts (Load, Store, Del) are left out
+def children(node):
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if type(value) is list:
+            for item in value:
+                if isinstance(item, ast.AST):
+                    yield item
+        elif isinstance(value, ast.AST) and field != "ctx":
+            yield value
+
+
+# Compact representation of a parsed file as parallel arrays in visiting order:
+# node type codes, parent indices, line spans and IDs of identifiers and constants
+# interned per file (-1 if none). Matchers are run once per distinct value of the file.
+# Nodes are not kept, the source is parsed again only when a finding needs its node.
+class FlatTree:
+    def __init__(self, src, tree=None, data=None):
+        self.ids = {}
+        self.nodes = None  # Nodes in visiting order, set when needed
+        self.src = src
+        self.tables = {}  # Matcher -> match of each value, indexed by value ID + 1
+        self.tree = tree
+
+        if data is not None:
+            types, parents, line_start, line_end, values, self.values = data
+            self.types = array.array("H", types)
+            self.parents = array.array("i", parents)
+            self.line_start = array.array("i", line_start)
+            self.line_end = array.array("i", line_end)
+            self.value_ids = array.array("i", values)
+        else:
+            self.types = array.array("H")
+            self.parents = array.array("i")
+            self.line_start = array.array("i")
+            self.line_end = array.array("i")
+            self.value_ids = array.array("i")
+            self.values = []
+            self.add(tree)
+
+    def __len__(self):
+        return len(self.types)
+
+    def add(self, tree):
+        # Iterative pre-order walk, nodes are pushed in reverse to keep visiting order
+        append_type, append_parent = self.types.append, self.parents.append
+        append_start, append_end, append_value = self.line_start.append, self.line_end.append, self.value_ids.append
+        stack = [(tree, -1)]
+
+        while stack:
+            node, parent = stack.pop()
+            index = len(self.types)
+            node_type = type(node)
+            code = TYPE_CODES.get(node_type)
+
+            append_type(code if code is not None else type_code(node_type))
+            append_parent(parent)
+            append_start(getattr(node, "lineno", 0))
+            append_end(getattr(node, "end_lineno", 0) or 0)
+
+            if node_type is ast.Call:
+                append_value(self.intern(call_name(node)))
+            elif node_type in VALUE_FIELDS:
+                append_value(self.intern(getattr(node, VALUE_FIELDS[node_type])))
+            else:
+                append_value(-1)
+
+            items = []
+
+            for field in node._fields:
+                value = getattr(node, field, None)
+                if type(value) is list:
+                    items.extend([(x, index) for x in value if isinstance(x, ast.AST)])
+                elif isinstance(value, ast.AST) and field != "ctx":
+                    items.append((value, index))
+
+            stack.extend(reversed(items))
+
+    def ancestors(self, index):
+        # Node itself and its parents up to the root
+        while index != -1:
+            yield index
+            index = self.parents[index]
+
+    def dump(self):
+        arrays = [self.types, self.parents, self.line_start, self.line_end, self.value_ids]
+        return [x.tobytes() for x in arrays] + [self.values]
+
+    def get_node(self, index):
+        if self.nodes is None:
+            if self.tree is None:
+                self.tree = ast.parse(self.src)
+
+            self.nodes = []
+            stack = [self.tree]
+
+            while stack:
+                node = stack.pop()
+                self.nodes.append(node)
+                stack.extend(reversed(list(children(node))))
+
+        return self.nodes[index]
+
+    def get_type(self, index):
+        return TYPES[self.types[index]]
+
+    def get_value(self, index):
+        value_id = self.value_ids[index]
+        return self.values[value_id] if value_id != -1 else None
+
+    def intern(self, value):
+        key = (type(value), value)  # Keep 1, 1.0 and True apart
+        value_id = self.ids.get(key)
+
+        if value_id is None:
+            value_id = self.ids[key] = len(self.values)
+            self.values.append(value)
+
+        return value_id
+
+    def match_table(self, matcher):
+        table = self.tables.get(matcher)
+
+        if table is None:
+            table = bytearray(1)  # Nodes without value never match
+            table.extend([type(value) is str and matcher.match(value) for value in self.values])
+            self.tables[matcher] = table
+
+        return table
+
+    def select(self, node_type, matcher=None):
+        # Indices of nodes of given type whose value is matched by matcher
+        if node_type not in TYPE_CODES:
+            return []
+
+        code = TYPE_CODES[node_type]
+        table = self.match_table(matcher) if matcher else None
+
+        numpy = get_numpy()
+
+        if numpy is not None:
+            mask = numpy.frombuffer(self.types, dtype=numpy.uint16) == code
+            if table is not None:
+                values = numpy.frombuffer(self.value_ids, dtype=numpy.intc)
+                mask &= numpy.frombuffer(table, dtype=numpy.bool_)[values + 1]
+            return numpy.flatnonzero(mask).tolist()
+
+        if table is None:
+            return [ii for ii, x in enumerate(self.types) if x == code]
+
+        return [ii for ii, (x, y) in enumerate(zip(self.types, self.value_ids)) if x == code and table[y + 1]]
+
+
+# Flattened trees stored on disk by hash of the source, so files scanned before are
+# queried without being parsed. Type codes and marshal format depend on the Python
+# version, which is part of the cache directory.
+class FlatCache:
+    PATH = os.path.join(CACHE_DIR, f"flat-{sys.implementation.cache_tag}")
+    VERSION = 1
+
+    def __init__(self, path=PATH):
+        self.n_hits = 0
+        self.path = path
+
+    def get_path(self, src):
+        key = hashlib.sha1(src).hexdigest()
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def load(self, src):
+        try:
+            with open(self.get_path(src), "rb") as f:
+                version, data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if version != self.VERSION:
+            return None
+
+        self.n_hits += 1
+        return FlatTree(src, data=data)
+
+    def save(self, flat):
+        # Cache is optional, ignore errors when it can't be written
+        path = self.get_path(flat.src)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                marshal.dump((self.VERSION, flat.dump()), f)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError):
+            return
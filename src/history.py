@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import subprocess
+
+from .baseline import fingerprint
+from .scanner import Scanner
+
+
+# Scanner for a range of revisions of a local git repository. Files are read from
+# the object store without checking revisions out and findings are memoized by blob
+# hash, so each distinct version of a file is parsed and visited only once.
+class HistoryScanner(Scanner):
+    BATCH = 256  # Commits per git name-rev call
+
+    def __init__(self, log, revisions, **kwargs):
+        super().__init__(log, **kwargs)
+        self.blobs = {}  # Blob hash -> findings in blob
+        self.captured = None
+        self.commits = []
+        self.findings = {}  # Fingerprint -> finding with first and last commit
+        self.n_errors = 0
+        self.releases = {}  # Commit index -> closest tag containing the commit
+        self.revisions = revisions
+
+        if self.previsitors:
+            self.log.error("Methods using previsitors can't be run on history")
+
+    def git(self, path, *args):
+        try:
+            return subprocess.run(["git", "-C", path, *args], capture_output=True, check=True).stdout
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, "stderr", b"") or b""
+            self.log.error(f"Error running git {' '.join(args)}: {stderr.decode().strip() or e}")
+
+    def get_releases(self, path, indices):
+        # Closest tag containing each of the commits, i.e. the first release which
+        # has the commit in its ancestry (names are like "v1.2~3^2~1" or "undefined")
+        indices = sorted(indices)
+        releases = {}
+
+        for ii in range(0, len(indices), self.BATCH):
+            batch = indices[ii : ii + self.BATCH]
+            names = self.git(path, "name-rev", "--tags", "--name-only", *[self.commits[x] for x in batch])
+
+            for index, name in zip(batch, names.decode().split()):
+                tag = name.split("~", 1)[0].split("^", 1)[0]
+                releases[index] = tag[5:] if tag.startswith("tags/") else tag if tag != "undefined" else None
+
+        return releases
+
+    def iter_tree_files(self, path, commit):
+        for entry in self.git(path, "ls-tree", "-r", "-z", commit).split(b"\0"):
+            if not entry:
+                continue
+
+            info, filename = entry.split(b"\t", 1)
+            mode, kind, blob = info.split(b" ")
+            filename = filename.decode("utf-8", "surrogateescape")
+            parts = filename.split("/")
+
+            if kind != b"blob" or filename.rsplit(".", 1)[-1] not in self.extensions:
+                continue
+            if any([x in self.skip for x in parts[:-1]]):
+                continue
+
+            yield filename, blob.decode()
+
+    def print_result(self, state, msg, print_source=True, print_state=True, visitor=None):
+        self.captured.append(self.get_finding(state, msg, visitor))
+
+    def print_history(self, path):
+        clr = self.log.clr
+        findings = sorted(
+            self.findings.values(), key=lambda x: (x["first"], x["finding"]["filename"], x["finding"]["line_start"])
+        )
+        self.releases = self.get_releases(path, set([x["first"] for x in findings] + [x["last"] for x in findings]))
+
+        for item in findings:
+            finding = item["finding"]
+            fn = " " + ".".join([f"{clr.FUNC}{x}{clr.NONE}" for x in finding["fn"]]) if finding["fn"] else ""
+            cf = " " + "->".join([f"{clr.FLOW}{x}{clr.NONE}" for x in finding["cf"]]) if finding["cf"] else ""
+            print(
+                f'{clr.FILE}{finding["filename"]}{clr.NONE}:{clr.LINE}{finding["line_start"]}{clr.NONE}'
+                f'{fn}{cf}: {clr.MSGS}{finding["msg"]}{clr.NONE}'
+            )
+
+            first = self.format_commit(item["first"])
+            last = self.format_commit(item["last"]) if item["last"] < len(self.commits) - 1 else "still present"
+            print(f"    first: {first}, last: {last}")
+
+    def format_commit(self, index):
+        release = self.releases.get(index)
+        return self.commits[index][:12] + (f" (released in {release})" if release else "")
+
+    def scan(self, path):
+        self.root = "."
+        self.commits = self.git(path, "rev-list", "--reverse", "--topo-order", *self.revisions.split()).decode().split()
+        reader = subprocess.Popen(
+            ["git", "-C", path, "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+
+        try:
+            for index, commit in enumerate(self.commits):
+                for filename, blob in self.iter_tree_files(path, commit):
+                    if blob not in self.blobs:
+                        self.blobs[blob] = self.scan_blob(filename, self.read_blob(reader, blob))
+
+                    self.update_findings(index, filename, self.blobs[blob])
+        finally:
+            reader.stdin.close()
+            reader.wait()
+
+        self.n_findings = len(self.findings)
+        self.print_history(path)
+
+    def read_blob(self, reader, blob):
+        reader.stdin.write(f"{blob}\n".encode())
+        reader.stdin.flush()
+        size = int(reader.stdout.readline().split()[2])
+        src = reader.stdout.read(size)
+        reader.stdout.read(1)  # Trailing newline
+
+        return src
+
+    def scan_blob(self, filename, src):
+        self.captured = []
+
+        try:
+            self.scan_source(filename, src, self.visitors)
+        except (SyntaxError, ValueError):
+            self.n_errors += 1  # Revisions may contain code for other Python versions
+
+        return self.captured
+
+    def update_findings(self, index, filename, findings):
+        occurrences = {}
+
+        for finding in findings:
+            finding = dict(finding, filename=filename)
+            base = fingerprint(finding)
+            occurrence = occurrences.get(base, 0)
+            occurrences[base] = occurrence + 1
+            fp = fingerprint(finding, occurrence) if occurrence else base
+
+            if fp not in self.findings:
+                self.findings[fp] = {"finding": finding, "first": index, "last": index}
+            else:
+                self.findings[fp]["last"] = index
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import array
+import hashlib
+import json
+import os
+import re
+import struct
+
+from .matcher import Matcher
+
+
+def trigrams(data):
+    return set([(a << 16) | (b << 8) | c for a, b, c in zip(data, data[1:], data[2:])])
+
+
+# Literals of which at least one needs to be in source for keyword to match or None
+# if the keyword can't be checked with the index
+def keyword_literals(keyword):
+    if type(keyword) is bytes:
+        return [keyword]
+    elif type(keyword) is re.Pattern:
+        try:
+            literals = Matcher(keyword.pattern.decode()).literals
+        except (UnicodeDecodeError, re.error):
+            return None
+        return [x.encode() for x in literals] if literals is not None else None
+
+    return None
+
+
+# Persistent trigram index used to select files which can contain required keywords
+# of visitors without reading them. Files are re-indexed when their mtime or size
+# changes and their hash differs. Postings of changed files are kept until there are
+# more stale than live entries, then the index is compacted.
+class TrigramIndex:
+    MAGIC = b"astvuln-trigrams-1\n"
+
+    def __init__(self, log, path):
+        self.changed = False
+        self.files = []  # [path, mtime, size, hash, live]
+        self.ids = {}  # Path -> file ID of live entry
+        self.log = log
+        self.n_indexed = 0
+        self.path = path
+        self.postings = {}  # Trigram -> file IDs
+
+        if os.path.exists(path):
+            self.load()
+
+    def add(self, path, stat, src):
+        file_id = len(self.files)
+        self.files.append([path, stat.st_mtime_ns, stat.st_size, hashlib.sha1(src).hexdigest(), True])
+        self.ids[path] = file_id
+        self.n_indexed += 1
+        self.changed = True
+
+        for trigram in trigrams(src):
+            if trigram not in self.postings:
+                self.postings[trigram] = array.array("I")
+            self.postings[trigram].append(file_id)
+
+    def candidates(self, visitors):
+        # IDs of files which may be matched by any of the visitors or None for all
+        selected = set()
+
+        for visitor in visitors:
+            matched = None
+
+            for keyword in visitor.required:
+                literals = keyword_literals(keyword)
+                if literals is None:
+                    continue
+
+                ids = self.lookup_any(literals)
+                if ids is not None:
+                    matched = ids if matched is None else matched & ids
+
+            if matched is None:
+                return None
+
+            selected |= matched
+
+        return selected
+
+    def compact(self):
+        live = [ii for ii, x in enumerate(self.files) if x[4]]
+        remap = {x: ii for ii, x in enumerate(live)}
+        postings = {}
+
+        for trigram, ids in self.postings.items():
+            ids = array.array("I", [remap[x] for x in ids if x in remap])
+            if ids:
+                postings[trigram] = ids
+
+        self.files = [self.files[x] for x in live]
+        self.ids = {x[0]: ii for ii, x in enumerate(self.files)}
+        self.postings = postings
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC:
+                    self.log.error(f"Unsupported index format: {self.path}")
+
+                (size,) = struct.unpack("<I", f.read(4))
+                self.files = json.loads(f.read(size).decode())
+                (count,) = struct.unpack("<I", f.read(4))
+
+                for _ in range(count):
+                    trigram, n = struct.unpack("<II", f.read(8))
+                    ids = array.array("I")
+                    ids.frombytes(f.read(n * ids.itemsize))
+                    self.postings[trigram] = ids
+        except (OSError, ValueError, struct.error) as e:
+            self.log.error(f'Error reading index "{self.path}": {e}')
+
+        self.ids = {x[0]: ii for ii, x in enumerate(self.files) if x[4]}
+
+    def lookup(self, literal):
+        # Intersection of postings of all trigrams in literal, rarest first
+        if len(literal) < 3:
+            return None
+
+        postings = sorted([self.postings.get(x, ()) for x in trigrams(literal)], key=len)
+        ids = set(postings[0])
+
+        for posting in postings[1:]:
+            if not ids:
+                break
+            ids.intersection_update(posting)
+
+        return ids
+
+    def lookup_any(self, literals):
+        ids = set()
+
+        for literal in literals:
+            found = self.lookup(literal)
+            if found is None:
+                return None
+            ids |= found
+
+        return ids
+
+    def save(self):
+        if not self.changed:
+            return
+
+        if len(self.files) > 2 * len(self.ids):
+            self.compact()
+
+        tmp_path = f"{self.path}.tmp"
+        header = json.dumps(self.files).encode()
+
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(self.MAGIC)
+                f.write(struct.pack("<I", len(header)))
+                f.write(header)
+                f.write(struct.pack("<I", len(self.postings)))
+
+                for trigram, ids in self.postings.items():
+                    f.write(struct.pack("<II", trigram, len(ids)))
+                    f.write(ids.tobytes())
+
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.log.error(f'Error writing index "{self.path}": {e}')
+
+        self.changed = False
+
+    def select(self, root, paths, visitors):
+        # Update index with files in paths and return those which may match
+        files, seen = [], set()
+
+        for path in paths:
+            key = os.path.abspath(path)
+            seen.add(key)
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                files.append((path, None))  # Let scanner report the error
+                continue
+
+            file_id = self.ids.get(key)
+            entry = self.files[file_id] if file_id is not None else None
+
+            if entry is None or entry[1] != stat.st_mtime_ns or entry[2] != stat.st_size:
+                try:
+                    with open(path, "rb") as f:
+                        src = f.read()
+                except OSError:
+                    files.append((path, None))
+                    continue
+
+                if entry is not None and entry[3] == hashlib.sha1(src).hexdigest():
+                    entry[1], entry[2] = stat.st_mtime_ns, stat.st_size  # Only touched
+                    self.changed = True
+                else:
+                    if entry is not None:
+                        entry[4] = False
+                    self.add(key, stat, src)
+
+            files.append((path, self.ids[key]))
+
+        # Files under root which no longer exist
+        prefix = os.path.join(os.path.abspath(root), "")
+
+        for key in [x for x in self.ids if x.startswith(prefix) and x not in seen]:
+            self.files[self.ids.pop(key)][4] = False
+            self.changed = True
+
+        selected = self.candidates(visitors)
+        return [path for path, file_id in files if selected is None or file_id is None or file_id in selected]
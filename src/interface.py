@@ -6,8 +6,14 @@
 import datetime
 import os
 
-from . import visitors
+from .baseline import Baseline
+from .checkpoint import Checkpoint
 from .common import Colors, Log
+from .distributed import JOB, Coordinator, ShardScanner, Worker, read_json
+from .history import HistoryScanner
+from .index import TrigramIndex
+from .registry import Registry
+from .sampling import Sampler
 from .scanner import Scanner
 
 
@@ -16,26 +22,38 @@ class Interface:
     PARAMS = {
         "arg_string": {"args": ["-a", "--args"], "value": True, "default": "", "help": "Arguments for method"},
         "help": {"args": ["-h", "--help"], "value": False, "help": "Show help and exit"},
+        "baseline": {"args": ["-b", "--baseline"], "value": True, "default": "", "help": "Baseline of known findings"},
+        "by_repository": {"args": ["-R", "--by-repository"], "value": False, "help": "Shard by top-level directory"},
+        "checkpoint": {"args": ["-k", "--checkpoint"], "value": True, "default": "", "help": "Save progress to file"},
+        "distribute": {"args": ["-D", "--distribute"], "value": True, "default": "", "help": "Coordinate sharded scan"},
         "extensions": {"args": ["-e", "--extensions"], "value": True, "default": "py", "help": "Extensions to process"},
+        "flat": {"args": ["-f", "--flat"], "value": False, "help": "Query flattened AST if possible"},
         "grepable": {"args": ["-g", "--grepable"], "value": False, "help": "Make results easier to grep"},
+        "history": {"args": ["-H", "--history"], "value": True, "default": "", "help": "Scan git revisions (range)"},
+        "index": {"args": ["-i", "--index"], "value": True, "default": "", "help": "Trigram index to select files"},
+        "jobs": {"args": ["-j", "--jobs"], "value": True, "default": "0", "help": "Local workers for sharded scan"},
+        "max_memory": {"args": ["-m", "--max-memory"], "value": True, "default": "256", "help": "Prefetch limit in MB"},
         "no_colors": {"args": ["-c", "--no-colors"], "value": False, "help": "Don't print colors"},
         "no_source": {"args": ["-n", "--no-source"], "value": False, "help": "Don't print source code"},
         "path": {"args": ["-p", "--path"], "value": True, "default": ".", "help": "Starting directory"},
+        "queue_depth": {"args": ["-q", "--queue-depth"], "value": True, "default": "64", "help": "Files to prefetch"},
+        "resume": {"args": ["-K", "--resume"], "value": False, "help": "Resume scan from checkpoint"},
+        "rules": {"args": ["-r", "--rules"], "value": True, "default": "", "help": "Directories with external rules"},
+        "sample": {"args": ["-S", "--sample"], "value": True, "default": "", "help": "Files to sample (count or %)"},
+        "seed": {"args": ["-x", "--seed"], "value": True, "default": "0", "help": "Seed for sampling files"},
+        "shards": {"args": ["-N", "--shards"], "value": True, "default": "16", "help": "Shards in sharded scan"},
         "skip": {"args": ["-s", "--skip"], "value": True, "default": "tests", "help": "Paths to skip"},
+        "stratify": {"args": ["-d", "--stratify"], "value": False, "help": "Sample each directory separately"},
+        "threads": {"args": ["-t", "--threads"], "value": True, "default": "0", "help": "Threads prefetching files"},
+        "time_budget": {"args": ["-T", "--time-budget"], "value": True, "default": "", "help": "Seconds to sample"},
+        "update_baseline": {"args": ["-u", "--update-baseline"], "value": False, "help": "Write findings to baseline"},
+        "worker": {"args": ["-W", "--worker"], "value": True, "default": "", "help": "Work on sharded scan"},
     }
 
     def __init__(self, args):
         self.args = []
         self.name = args[0]
         self.method = None
-        self.visitors = {}
-
-        # Load visitors
-        for name in dir(visitors):
-            if name.startswith("Visitor"):
-                visitor = getattr(visitors, name)
-                if visitor.NAME:
-                    self.visitors[visitor.NAME] = visitor
 
         # Allow multiple short arguments in same argument
         for arg in args[1:]:
@@ -49,26 +67,107 @@ class Interface:
         self.clr = Colors(self.no_colors or os.environ.get("NO_COLOR", False))
         self.log = Log(self.clr)
 
-        if self.help or self.method is None:
+        # Workers run methods and options of the job they work on
+        if self.worker:
+            try:
+                self.job = read_json(os.path.join(self.worker, JOB))
+            except (OSError, ValueError) as e:
+                self.log.error(f'Error reading job in "{self.worker}": {e}')
+
+            self.rules = ",".join(self.job["rules"])
+            self.flat = self.job["flat"]
+            self.no_source = not self.job["print_source"]
+
+        # Visitor modules are only imported when selected
+        self.registry = Registry(self.log, [x for x in self.rules.split(",") if x])
+
+        if self.help or (self.method is None and not self.worker):
             self.print_help()
 
+        if self.update_baseline and not self.baseline:
+            self.log.error("Baseline file needs to be specified to update it")
+        if self.history and self.baseline:
+            self.log.error("Baseline can't be used when scanning history")
+        if self.history and self.distribute:
+            self.log.error("History can't be scanned in sharded scan")
+        if self.resume and not self.checkpoint:
+            self.log.error("Checkpoint file needs to be specified to resume scan")
+        if self.checkpoint and (self.history or self.distribute):
+            self.log.error("Checkpoints can't be used when scanning history or in sharded scan")
+        if self.index and (self.history or self.distribute):
+            self.log.error("Index can't be used when scanning history or in sharded scan")
+        if self.stratify and not (self.sample or self.time_budget):
+            self.log.error("Sample size or time budget needs to be specified to stratify sample")
+        if (self.sample or self.time_budget) and (self.history or self.distribute or self.checkpoint):
+            self.log.error("Sampling can't be used when scanning history, in sharded scan or with checkpoints")
+
         self.scanner_config = {
+            "baseline": Baseline(self.log, self.baseline, self.update_baseline, self.resume) if self.baseline else None,
             "extensions": self.extensions.split(","),
             "skip": self.skip.split(","),
+            "flat": self.flat,
             "grepable": self.grepable,
+            "index": TrigramIndex(self.log, self.index) if self.index else None,
             "print_source": not self.no_source,
+            "readers": self.get_int("threads"),
+            "queue_depth": self.get_int("queue_depth"),
+            "max_memory": self.get_int("max_memory") * 1024 * 1024,
             "visitor_configs": self.get_visitor_configs(),
         }
 
+        if self.checkpoint:
+            job = {
+                "path": os.path.abspath(self.path),
+                "extensions": self.scanner_config["extensions"],
+                "skip": self.scanner_config["skip"],
+                "methods": [[x["method"], x["arg_string"]] for x in self.scanner_config["visitor_configs"]],
+            }
+            self.scanner_config["checkpoint"] = Checkpoint(self.log, self.checkpoint, job, self.resume)
+
+        if self.sample or self.time_budget:
+            self.scanner_config["sampler"] = self.get_sampler()
+
+    def get_int(self, param):
+        value = getattr(self, param)
+
+        if not value.isnumeric():
+            self.log.error(f'Invalid value "{value}" for {self.PARAMS[param]["args"][1]}')
+
+        return int(value)
+
+    def get_sampler(self):
+        size, fraction = None, None
+
+        if self.sample.endswith("%"):
+            try:
+                fraction = float(self.sample[:-1]) / 100
+            except ValueError:
+                fraction = -1
+
+            if not 0 < fraction <= 1:
+                self.log.error(f'Invalid value "{self.sample}" for --sample')
+        elif self.sample:
+            size = self.get_int("sample")
+
+        return Sampler(
+            self.seed,
+            size,
+            fraction,
+            self.get_int("time_budget") if self.time_budget else None,
+            self.stratify,
+        )
+
     def get_visitor_config(self, method, arg_string):
-        if method in self.visitors:
-            visitor = self.visitors[method]
-        else:
+        visitor = self.registry.get(method)
+
+        if visitor is None:
             self.log.error(f'Unknown method "{method}"')
 
         visitor_args, visitor_kwargs = self.parse_visitor_args(arg_string)
         return {
             "visitor": visitor,
+            "method": method,
+            "arg_string": arg_string,
             "args": visitor_args,
             "kwargs": visitor_kwargs,
         }
@@ -76,7 +175,11 @@ class Interface:
     def get_visitor_configs(self):
         visitor_configs = []
 
-        if self.method == "file":
+        if self.worker:
+            # Configure visitors from job
+            for method, arg_string in self.job["methods"]:
+                visitor_configs.append(self.get_visitor_config(method, arg_string))
+        elif self.method == "file":
             # Configure visitors from file
             try:
                 with open(self.arg_string, "r") as f:
@@ -155,11 +258,13 @@ class Interface:
     def print_help(self):
         methods, params, usage = ([], []), [], []
 
-        for method in sorted(self.visitors.keys()):
-            visitor = self.visitors[method]
-            args = " ({})".format(", ".join(visitor.ARGS)) if visitor.ARGS else ""
-            group = 0 if visitor.COMMON else 1
-            methods[group].append(f"    {method:25} {visitor.HELP}{args}")
+        visitors = self.registry.entries()
+
+        for method in sorted(visitors.keys()):
+            visitor = visitors[method]
+            args = " ({})".format(", ".join(visitor["args"])) if visitor["args"] else ""
+            group = 0 if visitor["common"] else 1
+            methods[group].append(f"    {method:25} {visitor['help']}{args}")
 
         for x in self.PARAMS.values():
             param = " <value>" if x["value"] else ""
@@ -198,8 +303,24 @@ class Interface:
 
         if self.log.clr.no_colors:
             flags.append("no colors")
+        if conf["flat"]:
+            flags.append("flat")
         if conf["grepable"]:
             flags.append("grepable")
+        if self.update_baseline:
+            flags.append("update baseline")
+        if self.distribute:
+            flags.append("sharded in {}".format(self.distribute))
+        if self.resume:
+            flags.append("resumed")
+        if conf.get("sampler"):
+            flags.append("sample of {} (seed {})".format(self.sample or "all", self.seed))
+        if self.time_budget:
+            flags.append("sampling for {} seconds".format(self.time_budget))
+        if self.stratify:
+            flags.append("stratified")
+        if conf["readers"]:
+            flags.append("{} threads prefetching".format(conf["readers"]))
 
         greeting = [
             "+---------------------------------[ astvuln ]---------------------------------+",
@@ -207,6 +328,8 @@ class Interface:
             "| Path:       {} |".format(self.f(self.path, 63)),
             "| Extensions: {} |".format(self.f(", ".join(conf["extensions"]), 63)),
             "| Skip:       {} |".format(self.f(", ".join(conf["skip"]), 63)),
+            "| History:    {} |".format(self.f(self.history, 63)),
+            "| Baseline:   {} |".format(self.f(self.baseline, 63)),
             "| Flags:      {} |".format(self.f(", ".join(flags), 63)),
             "+-----------------------------------------------------------------------------+",
         ]
@@ -226,19 +349,85 @@ class Interface:
         self.log.plain("\n".join(greeting), self.log.clr.INFO)
 
     def run(self):
+        if self.worker:
+            return self.run_worker()
+
         self.print_greeting()
 
         start = datetime.datetime.now()
-        scanner = Scanner(self.log, **self.scanner_config)
+        if self.history:
+            scanner = HistoryScanner(self.log, self.history, **self.scanner_config)
+        elif self.distribute:
+            scanner = Coordinator(
+                self.log,
+                self.distribute,
+                [[x["method"], x["arg_string"]] for x in self.scanner_config["visitor_configs"]],
+                [x for x in self.rules.split(",") if x],
+                self.get_int("shards"),
+                self.by_repository,
+                self.get_int("jobs"),
+                **self.scanner_config,
+            )
+        else:
+            scanner = Scanner(self.log, **self.scanner_config)
+
+        baseline = self.scanner_config["baseline"]
+        interrupted = False
 
         try:
             scanner.scan(self.path)
         except KeyboardInterrupt:
             self.log.info("Interrupted, exiting")
+            interrupted = True
+
+        # Don't replace baseline with findings of a partial scan
+        if baseline is not None:
+            baseline.close(commit=not interrupted, keep=bool(self.checkpoint))
+        if self.checkpoint:
+            self.scanner_config["checkpoint"].finish(scanner, completed=not interrupted)
+        if self.index:
+            self.scanner_config["index"].save()
 
         duration = datetime.datetime.now() - start
+        suppressed = f" ({scanner.n_suppressed} in baseline)" if baseline is not None else ""
+
+        if self.index:
+            index = self.scanner_config["index"]
+            self.log.info("Index: {} files (re)indexed, {} files in index".format(index.n_indexed, len(index.ids)))
+
+        if self.sample or self.time_budget:
+            methods = []
+
+            for visitor, visitor_config in zip(scanner.visitors, self.scanner_config["visitor_configs"]):
+                label = visitor_config["method"]
+                if visitor_config["arg_string"]:
+                    label += " ({})".format(visitor_config["arg_string"])
+                methods.append((visitor, label))
+
+            for line in self.scanner_config["sampler"].report(methods):
+                self.log.info(line)
+
+        if self.history:
+            self.log.info(
+                "Scanned {} commits: {} distinct files, {} not parsed".format(
+                    len(scanner.commits), len(scanner.blobs), scanner.n_errors
+                )
+            )
+
         self.log.info(
-            "Ran {} rules on {} files: {} findings in {}".format(
-                len(scanner.visitors), scanner.n_files, scanner.n_findings, duration
+            "Ran {} rules on {} files: {} findings{} in {}".format(
+                len(scanner.visitors), scanner.n_files, scanner.n_findings, suppressed, duration
             )
         )
+
+    def run_worker(self):
+        start = datetime.datetime.now()
+        worker = Worker(self.log, self.worker, lambda: ShardScanner(self.log, **self.scanner_config))
+
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            self.log.info("Interrupted, exiting")
+
+        duration = datetime.datetime.now() - start
+        self.log.info(f"Worker {worker.id} processed {worker.n_shards} shards in {duration}")
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import re
+
+
+REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+
+
+# Literal string matched by pattern or None if pattern is not a plain literal
+def parse_literal(pattern):
+    chars = []
+    escaped = False
+
+    for char in pattern:
+        if escaped:
+            if char.isalnum():
+                return None  # Character class or reference, e.g. \d
+            chars.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char in REGEX_SPECIAL:
+            return None
+        else:
+            chars.append(char)
+
+    return None if escaped else "".join(chars)
+
+
+# Split pattern on top-level "|" (only for patterns without groups or sets)
+def split_alternatives(pattern):
+    parts, current = [], []
+    escaped = False
+
+    for char in pattern:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\":
+            current.append(char)
+            escaped = True
+        elif char in "([":
+            return [pattern]
+        elif char == "|":
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+
+    parts.append("".join(current))
+    return parts
+
+
+# Matcher compiled from method argument pattern. Pattern needs to match the whole
+# value. Plain literals and their alternations are matched with set lookups, literals
+# with leading or trailing ".*" with prefix and suffix checks, anything else as regex.
+class Matcher:
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.literals = None  # Literals of which one has to be present in matching value
+        self.regex = None
+
+        alternatives = split_alternatives(pattern)
+        literals = [parse_literal(x) for x in alternatives]
+
+        if all([x is not None for x in literals]):
+            self.kind = "literal"
+            self.literals = literals
+            self.values = frozenset(literals)
+            self.match = self.values.__contains__
+            return
+
+        if len(alternatives) == 1:
+            prefix = pattern.startswith(".*")
+            suffix = pattern.endswith(".*") and not pattern.endswith("\\.*")
+            literal = parse_literal(pattern[2 if prefix else 0 : -2 if suffix else None])
+
+            if (prefix or suffix) and literal is not None and "\n" not in literal:
+                self.kind = "contains" if prefix and suffix else "suffix" if prefix else "prefix"
+                self.literals = [literal]
+                self.literal = literal
+                self.match = getattr(self, f"match_{self.kind}")
+                return
+
+        self.kind = "regex"
+        self.regex = re.compile(f"(?:{pattern})")
+        self.match = self.match_regex
+
+    # Any character matched by ".*" can't be a newline
+    def match_contains(self, value):
+        return self.literal in value and "\n" not in value
+
+    def match_prefix(self, value):
+        return value.startswith(self.literal) and "\n" not in value[len(self.literal) :]
+
+    def match_suffix(self, value):
+        return value.endswith(self.literal) and "\n" not in value[: len(value) - len(self.literal)]
+
+    def match_regex(self, value):
+        return self.regex.fullmatch(value) is not None
+
+    def keyword(self):
+        # Keyword which needs to be present in source for a match
+        if self.literals is not None and len(self.literals) == 1:
+            return self.literals[0].encode()
+
+        return re.compile(self.pattern.encode())
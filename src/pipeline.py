@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import collections
+import concurrent.futures
+import os
+import queue
+import threading
+
+
+# Pipeline reading files ahead in background threads so disk reads overlap with
+# parsing. A walker thread lists files, reader threads prefetch their contents and
+# files are yielded in walk order. Number of prefetched files and their total size
+# are bounded by queue depth and memory limit (at least one file is always read).
+class Prefetcher:
+    def __init__(self, readers=4, depth=64, max_memory=256 * 1024 * 1024):
+        self.depth = max(depth, 1)
+        self.max_memory = max_memory
+        self.readers = max(readers, 1)
+
+    @staticmethod
+    def read_file(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def walk(self, paths, files, stop):
+        try:
+            for path in paths:
+                if stop.is_set():
+                    break
+
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = 0  # Error is raised by reader
+
+                while not stop.is_set():
+                    try:
+                        files.put((path, size), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        finally:
+            if not stop.is_set():
+                files.put(None)
+
+    def read(self, paths):
+        files = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        walker = threading.Thread(target=self.walk, args=(paths, files, stop), daemon=True)
+        executor = concurrent.futures.ThreadPoolExecutor(self.readers)
+        pending = collections.deque()
+        buffered = 0
+        done = False
+        item = None
+
+        walker.start()
+
+        try:
+            while True:
+                # Fill the window while there is room for the next file
+                while not done and len(pending) < self.depth:
+                    if item is None:
+                        item = files.get()
+                        if item is None:
+                            done = True
+                            break
+
+                    if pending and buffered + item[1] > self.max_memory:
+                        break
+
+                    pending.append((item[0], item[1], executor.submit(self.read_file, item[0])))
+                    buffered += item[1]
+                    item = None
+
+                if not pending:
+                    break
+
+                path, size, future = pending.popleft()
+                buffered -= size
+                yield path, future.result()
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import importlib
+import importlib.util
+import json
+import os
+import sys
+
+from . import visitors
+from .common import CACHE_DIR
+
+
+# Lazy visitor registry backed by a manifest cached on disk. Visitor modules are
+# only imported when the manifest is stale or when one of their visitors is used.
+class Registry:
+    MANIFEST = os.path.join(CACHE_DIR, "manifest.json")
+    VERSION = 1
+
+    def __init__(self, log, rule_dirs=[], manifest=MANIFEST):
+        self.log = log
+        self.manifest_path = manifest
+        self.modules = {}  # Module path -> module name
+        self.visitors = {}  # Visitor name -> manifest entry
+
+        builtin_dir = os.path.dirname(visitors.__file__)
+        for name in visitors.MODULES:
+            self.modules[os.path.join(builtin_dir, f"{name}.py")] = f"{visitors.__name__}.{name}"
+
+        for ii, rule_dir in enumerate(rule_dirs):
+            if not os.path.isdir(rule_dir):
+                self.log.error(f"Rules directory does not exist: {rule_dir}")
+
+            for filename in sorted(os.listdir(rule_dir)):
+                if filename.endswith(".py") and not filename.startswith("_"):
+                    path = os.path.abspath(os.path.join(rule_dir, filename))
+                    self.modules[path] = f"astvuln_rules_{ii}_{filename[:-3]}"
+
+        self.load_manifest()
+
+    def entries(self):
+        return self.visitors
+
+    def get(self, name):
+        if name not in self.visitors:
+            return None
+
+        entry = self.visitors[name]
+        module = self.import_module(entry["path"], entry["module"])
+        return getattr(module, entry["class"])
+
+    def import_module(self, path, name):
+        if name in sys.modules:
+            return sys.modules[name]
+
+        if name.startswith(visitors.__name__ + "."):
+            return importlib.import_module(name)
+
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+
+        try:
+            spec.loader.exec_module(module)
+        except Exception as e:
+            del sys.modules[name]
+            self.log.error(f'Error loading rules from "{path}": {e}')
+
+        return module
+
+    def inspect_module(self, path, name):
+        module = self.import_module(path, name)
+        found = {}
+
+        for attr, value in vars(module).items():
+            if not attr.startswith("Visitor") or not isinstance(value, type):
+                continue
+
+            # Skip visitors imported from other modules
+            if value.__module__ != module.__name__ or not getattr(value, "NAME", ""):
+                continue
+
+            found[value.NAME] = {
+                "class": attr,
+                "help": value.HELP,
+                "args": list(value.ARGS),
+                "common": value.COMMON,
+            }
+
+        return found
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != self.VERSION:
+                manifest = {}
+        except (OSError, ValueError):
+            manifest = {}
+
+        cached = manifest.get("modules", {})
+        modules, changed = {}, False
+
+        for path, name in self.modules.items():
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                self.log.error(f'Error reading "{path}": {e}')
+
+            entry = cached.get(path)
+            key = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "module": name}
+
+            if not entry or any([entry[k] != v for k, v in key.items()]):
+                entry = dict(key, visitors=self.inspect_module(path, name))
+                changed = True
+
+            modules[path] = entry
+
+            # Later modules (external rules) override visitors with the same name
+            for visitor_name, visitor in entry["visitors"].items():
+                self.visitors[visitor_name] = dict(visitor, path=path, module=name)
+
+        # Keep entries of other rule directories so alternating runs stay cached
+        if changed:
+            self.save_manifest({"version": self.VERSION, "modules": {**cached, **modules}})
+
+    def save_manifest(self, manifest):
+        # Manifest is only a cache, ignore errors when it can't be written
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError:
+            return
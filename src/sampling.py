@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021 Bitstamp Ltd
+# This code is licensed under the MIT license. See LICENSE.md for license terms.
+
+import hashlib
+import math
+import os
+import time
+
+
+# Reproducible random sample of scanned files used to quickly estimate how many
+# findings a method would report on the whole corpus. Files are ordered by hash of
+# seed and relative path, so the same seed selects the same files regardless of walk
+# order. Sample is either simple or stratified by top-level directory (with sizes
+# proportional to number of files in each directory) and limited by number of files
+# and/or time. Totals are extrapolated with normal approximation confidence intervals.
+class Sampler:
+    Z = 1.96  # 95% confidence
+
+    def __init__(self, seed="0", size=None, fraction=None, time_budget=None, stratify=False):
+        self.files = {}  # Scanned path -> findings per method
+        self.fraction = fraction
+        self.population = {}  # Stratum -> number of files
+        self.seed = seed
+        self.size = size
+        self.started = None  # Time when first sampled file was scanned
+        self.strata = {}  # Selected path -> stratum
+        self.stratify = stratify
+        self.time_budget = time_budget
+        self.timed_out = False
+
+    def add_file(self, path):
+        self.files[path] = {}
+
+    def add_finding(self, path, method):
+        if path in self.files:
+            self.files[path][method] = self.files[path].get(method, 0) + 1
+
+    def allocate(self, budget):
+        # Proportional allocation rounded by largest remainder
+        total = sum(self.population.values())
+        quotas = {h: budget * n / total for h, n in self.population.items()}
+        allocation = {h: int(x) for h, x in quotas.items()}
+        remainders = sorted(quotas, key=lambda h: (allocation[h] - quotas[h], h))
+
+        for h in remainders[: budget - sum(allocation.values())]:
+            allocation[h] += 1
+
+        return allocation
+
+    def estimate(self, values):
+        # Estimated total with confidence interval (None if it can't be estimated)
+        # from per file values of each stratum. Strata with less than two scanned
+        # files are collapsed into one, as their variance can't be estimated.
+        sample = [y for ys in values.values() for y in ys]
+        strata = [(size, values.get(h, [])) for h, size in self.population.items()]
+        collapsed = [x for x in strata if len(x[1]) < 2]
+        strata = [x for x in strata if len(x[1]) >= 2]
+
+        if collapsed:
+            strata.append((sum([x[0] for x in collapsed]), [y for x in collapsed for y in x[1]]))
+
+        total, total_variance = 0.0, 0.0
+
+        for size, ys in strata:
+            if not ys:
+                # Directories without scanned files are estimated from the whole sample
+                total += size * sum(sample) / len(sample)
+                total_variance = None
+                continue
+
+            mean = sum(ys) / len(ys)
+            total += size * mean
+
+            if len(ys) < 2 or total_variance is None:
+                total_variance = None
+            else:
+                variance = sum([(y - mean) ** 2 for y in ys]) / (len(ys) - 1)
+                total_variance += size**2 * (1 - len(ys) / size) * variance / len(ys)
+
+        if total_variance is None:
+            return total, None, None
+
+        margin = self.Z * math.sqrt(total_variance)
+        return total, max(total - margin, sum(sample)), total + margin
+
+    def format_estimate(self, values):
+        total, low, high = self.estimate(values)
+        interval = f"{low:.0f}-{high:.0f}" if low is not None else "n/a, too few files"
+        return f"estimated {total:.0f} (95% CI {interval})"
+
+    def get_key(self, path):
+        return hashlib.sha1(f"{self.seed}:{path}".encode("utf-8", "surrogateescape")).hexdigest()
+
+    def get_stratum(self, path):
+        parts = path.split(os.sep, 1)
+        return parts[0] if self.stratify and len(parts) > 1 else ""
+
+    def expired(self):
+        # Checked by scanner before each file, as files may be queued long before
+        if self.time_budget is None:
+            return False
+
+        if self.started is None:
+            self.started = time.monotonic()
+        elif time.monotonic() - self.started > self.time_budget:
+            self.timed_out = True
+
+        return self.timed_out
+
+    def report(self, methods):
+        # Lines with estimates for each of (method, label) pairs
+        n, total = len(self.files), sum(self.population.values())
+        lines = [
+            "Sample: scanned {} of {} files ({:.1f}%), seed {}{}{}".format(
+                n,
+                total,
+                100 * n / total if total else 0,
+                self.seed,
+                f", stratified by {len(self.population)} directories" if self.stratify else "",
+                ", stopped by time budget" if self.timed_out else "",
+            )
+        ]
+
+        if not n:
+            return lines
+
+        for method, label in methods:
+            findings, files = {}, {}
+
+            for path, counts in self.files.items():
+                count = counts.get(method, 0)
+                findings.setdefault(self.strata[path], []).append(count)
+                files.setdefault(self.strata[path], []).append(1 if count else 0)
+
+            lines.append(
+                "    {}: {} findings in sample, {}, files with findings: {} in sample, {}".format(
+                    label,
+                    sum([sum(x) for x in findings.values()]),
+                    self.format_estimate(findings),
+                    sum([sum(x) for x in files.values()]),
+                    self.format_estimate(files),
+                )
+            )
+
+        return lines
+
+    def sample(self, root, paths):
+        # Select sample from paths and return them in random order
+        population = {}
+
+        for path in paths:
+            relpath = os.path.relpath(path, root)
+            population.setdefault(self.get_stratum(relpath), []).append((self.get_key(relpath), path))
+
+        self.population = {h: len(x) for h, x in population.items()}
+        total = sum(self.population.values())
+
+        if self.size is not None:
+            budget = min(self.size, total)
+        elif self.fraction is not None:
+            budget = min(math.ceil(total * self.fraction), total)
+        else:
+            budget = total
+
+        selected = []
+
+        for h, n in self.allocate(budget).items() if total else []:
+            for key, path in sorted(population[h])[:n]:
+                selected.append((key, path))
+                self.strata[path] = h
+
+        return [path for key, path in sorted(selected)]
@@ -5,18 +5,53 @@
 
 import ast
 import os
+import sys
+
+from .analysis import Analysis
+from .baseline import fingerprint, node_hash
+from .flat import FlatCache, FlatTree
+from .pipeline import Prefetcher
 
 
 # Recursive AST parser
 class Scanner:
-    def __init__(self, log, visitor_configs, extensions=["py"], skip=[], grepable=False, print_source=True):
+    def __init__(
+        self,
+        log,
+        visitor_configs,
+        extensions=["py"],
+        skip=[],
+        grepable=False,
+        print_source=True,
+        baseline=None,
+        checkpoint=None,
+        flat=False,
+        index=None,
+        readers=0,
+        queue_depth=64,
+        max_memory=256 * 1024 * 1024,
+        sampler=None,
+    ):
+        self.baseline = baseline
+        self.checkpoint = checkpoint
+        self.completed = {"n_files": 0, "n_findings": 0, "n_suppressed": 0}
         self.data = {}
         self.extensions = extensions
+        self.flat = flat
+        self.flat_cache = FlatCache() if flat else None
+        self.index = index
         self.grepable = grepable
         self.log = log
         self.n_files = 0
         self.n_findings = 0
+        self.n_suppressed = 0
+        self.last = None  # Last completed file in current phase relative to root
+        self.phase = None
+        self.prefetcher = Prefetcher(readers, queue_depth, max_memory) if readers else None
         self.print_source = print_source
+        self.printed = None  # File for which findings are being printed
+        self.root = "."
+        self.sampler = sampler
         self.skip = skip
         self.visitors = []
         self.visitor_configs = visitor_configs
@@ -30,74 +65,210 @@ class Scanner:
 
         self.previsitors = [previsitor(self) for previsitor in previsitors]
 
-    def print_result(self, state, msg, print_source=True, print_state=True):
+    def get_finding(self, state, msg, visitor=None):
+        return {
+            "filename": os.path.relpath(self.state["filename"], self.root),
+            "visitor": visitor.NAME if visitor else "",
+            "fn": [x[0] for x in state["fn"]],
+            "cf": [x[0] for x in state["cf"]],
+            "line_start": state["line_start"],
+            "line_end": state["line_end"],
+            "msg": msg,
+            "node_hash": node_hash(self.get_node(state)),
+        }
+
+    def get_fingerprint(self, finding):
+        # Identical findings in the same file are told apart by their order
+        base = fingerprint(finding)
+        occurrence = self.state["fingerprints"].get(base, 0)
+        self.state["fingerprints"][base] = occurrence + 1
+
+        return fingerprint(finding, occurrence) if occurrence else base
+
+    def get_flat_tree(self, src):
+        # Cached trees are used without parsing the source
+        flat = self.flat_cache.load(src)
+
+        if flat is None:
+            flat = FlatTree(src, tree=self.get_tree(src))
+            self.flat_cache.save(flat)
+
+        return flat
+
+    def get_node(self, state):
+        # Nodes of flattened trees are only looked up when needed for fingerprints
+        if state.get("flat_index") is not None:
+            return self.state["flat"].get_node(state["flat_index"])
+
+        return state.get("node")
+
+    def get_source(self, state):
+        if self.state["lines"] is None:
+            self.state["lines"] = self.state["src"].split(b"\n")
+
+        return [(n, self.state["lines"][n - 1].decode()) for n in range(state["line_start"], state["line_end"] + 1)]
+
+    def get_tree(self, src):
+        if self.state["ast"] is None:
+            self.state["ast"] = ast.parse(src)
+            self.state["analysis"] = Analysis(self.state["ast"])
+
+        return self.state["ast"]
+
+    def print_finding(self, filename, line, fn, cf, msg, source=None):
         self.n_findings += 1
         clr = self.log.clr
-        parts = [f'{clr.FILE}{self.state["filename"]}{clr.NONE}:' if self.grepable else "    "]
-        parts.append(f'{clr.LINE}{state["line_start"]}{clr.NONE}')
-
-        if print_state:
-            fn = " " + ".".join([f"{clr.FUNC}{x[0]}{clr.NONE}" for x in state["fn"]]) if state["fn"] else ""
-            cf = " " + "->".join([f"{clr.FLOW}{x[0]}{clr.NONE}" for x in state["cf"]]) if state["cf"] else ""
-            parts.append(f"{fn}{cf}")
+        parts = [f"{clr.FILE}{filename}{clr.NONE}:" if self.grepable else "    "]
+        parts.append(f"{clr.LINE}{line}{clr.NONE}")
 
+        fn = " " + ".".join([f"{clr.FUNC}{x}{clr.NONE}" for x in fn]) if fn else ""
+        cf = " " + "->".join([f"{clr.FLOW}{x}{clr.NONE}" for x in cf]) if cf else ""
+        parts.append(f"{fn}{cf}")
         parts.append(f": {clr.MSGS}{msg}{clr.NONE}")
 
-        if not self.grepable and not self.state["printed"]:
-            print(clr.FILE + self.state["filename"] + clr.NONE)
-            self.state["printed"] = True
+        if not self.grepable and filename != self.printed:
+            print(clr.FILE + filename + clr.NONE)
+            self.printed = filename
 
         print("".join(parts))
 
-        if print_source and self.print_source:
-            if self.state["lines"] is None:
-                self.state["lines"] = self.state["src"].split(b"\n")
+        if source:
+            print("\n".join([f"{clr.LINE}{n:4}{clr.NONE}:{line}" for n, line in source]))
+
+    def print_result(self, state, msg, print_source=True, print_state=True, visitor=None):
+        if self.baseline is not None or self.checkpoint is not None:
+            finding = self.get_finding(state, msg, visitor)
+            fp = self.get_fingerprint(finding)
+
+        if self.baseline is not None:
+            self.baseline.add(fp, finding)
+
+            if fp in self.baseline:
+                self.n_suppressed += 1
+                return
 
-            print(
-                "\n".join(
-                    [
-                        f'{clr.LINE}{n:4}{clr.NONE}:{self.state["lines"][n-1].decode()}'
-                        for n in range(state["line_start"], state["line_end"] + 1)
-                    ]
-                )
-            )
+        if self.checkpoint is not None and fp in self.checkpoint.emitted:
+            self.n_findings += 1  # Reported before scan was resumed
+            return
+
+        self.print_finding(
+            self.state["filename"],
+            state["line_start"],
+            [x[0] for x in state["fn"]] if print_state else [],
+            [x[0] for x in state["cf"]] if print_state else [],
+            msg,
+            self.get_source(state) if print_source and self.print_source else None,
+        )
+
+        if self.sampler is not None:
+            self.sampler.add_finding(self.state["filename"], visitor)
+
+        if self.checkpoint is not None:
+            sys.stdout.flush()
+            self.checkpoint.record(fp)
 
     def scan(self, path):
-        if self.previsitors:
-            self.scan_with_visitors(path, self.previsitors)
+        self.root = path if os.path.isdir(path) else os.path.dirname(path)
+        phases = [("previsit", self.previsitors), ("scan", self.visitors)]
+        resume_phase, resume_last = self.checkpoint.restore(self) if self.checkpoint else (None, None)
+
+        if resume_phase is not None:
+            phases = phases[[x[0] for x in phases].index(resume_phase) :]
+
+        for phase, visitors in phases:
+            if visitors:
+                self.phase = phase
+                self.last = resume_last if phase == resume_phase else None
+                self.scan_with_visitors(path, visitors)
 
-        self.scan_with_visitors(path, self.visitors)
+    def iter_paths(self, path):
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [x for x in dirs if x not in self.skip]
+
+            # Walk order needs to be stable to resume from checkpoint
+            if self.checkpoint is not None:
+                dirs.sort()
+                files.sort()
+
+            for filename in files:
+                if filename.rsplit(".", 1)[-1] in self.extensions:
+                    yield os.path.join(root, filename)
+
+    def scan_paths(self, paths, visitors):
+        sampled = self.sampler is not None and visitors is self.visitors
+
+        if self.prefetcher:
+            files = self.prefetcher.read(paths)
+
+            for path, src in files:
+                if sampled and self.sampler.expired():
+                    files.close()  # Stop prefetching
+                    break
+
+                self.scan_source(path, src, visitors)
+        else:
+            for path in paths:
+                if sampled and self.sampler.expired():
+                    break
+
+                self.scan_file(path, visitors)
 
     def scan_with_visitors(self, path, visitors):
         if os.path.exists(path):
             if os.path.isfile(path):
-                self.scan_file(path, visitors)
+                paths = [path]
+            elif self.index is not None:
+                paths = self.index.select(path, self.iter_paths(path), visitors)
             else:
-                for root, dirs, files in os.walk(path):
-                    dirs[:] = [x for x in dirs if x not in self.skip]
-                    for filename in files:
-                        if filename.rsplit(".", 1)[-1] in self.extensions:
-                            self.scan_file(os.path.join(root, filename), visitors)
+                paths = self.iter_paths(path)
+
+            # Previsitors collect data from all files, only scanned files are sampled
+            if self.sampler is not None and visitors is self.visitors:
+                paths = self.sampler.sample(path, paths)
+
+            if self.last is not None:
+                paths = self.checkpoint.remaining(self.root, paths, self.last)
+
+            self.scan_paths(paths, visitors)
         else:
             self.log.error(f"Path does not exist: {path}")
 
     def scan_file(self, path, visitors):
-        self.n_files += 1
-
         with open(path, "rb") as f:
             src = f.read()
 
+        self.scan_source(path, src, visitors)
+
+    def scan_source(self, path, src, visitors):
+        self.n_files += 1
+
+        if self.sampler is not None and visitors is self.visitors:
+            self.sampler.add_file(path)
+
         self.state = {
+            "analysis": None,  # Set with AST
             "ast": None,  # Set when needed
             "filename": path,
+            "fingerprints": {},
+            "flat": None,  # Set when needed
             "lines": None,  # Set when needed
-            "printed": False,
             "src": src,
         }
 
         for visitor in visitors:
-            if not visitor.skip(src):
-                if self.state["ast"] is None:
-                    self.state["ast"] = ast.parse(src)
+            if visitor.skip(src):
+                continue
+
+            if self.flat and visitor.supports_flat():
+                if self.state["flat"] is None:
+                    self.state["flat"] = self.get_flat_tree(src)
+
+                visitor.visit_flat(self.state["flat"])
+            else:
+                visitor.visit(self.get_tree(src))
+
+        self.last = os.path.relpath(path, self.root)
 
-                visitor.visit(self.state["ast"])
+        if self.checkpoint is not None:
+            self.completed = {"n_files": self.n_files, "n_findings": self.n_findings, "n_suppressed": self.n_suppressed}
+            self.checkpoint.save(self)
@@ -1,4 +1,15 @@
 # -*- coding: utf-8 -*-
 
-from .common import *
-from .custom import *
+import importlib
+
+# Visitor modules, imported lazily on first use (see src/registry.py)
+MODULES = ["common", "custom"]
+
+
+def __getattr__(name):
+    for module_name in MODULES:
+        module = importlib.import_module(f".{module_name}", __name__)
+        if hasattr(module, name):
+            return getattr(module, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,12 +6,15 @@
 import ast
 import re
 
+from ..analysis import types_mask
+
 
 # AST visitor base class
 class Visitor(ast.NodeVisitor):
     ARGS = []
     COMMON = True
     DEFAULTS = {}
+    FLAT = False  # Visitor implements visit_flat, see src/flat.py
     HELP = ""
     NAME = ""
     TYPES_CF = [
@@ -25,6 +28,7 @@ class Visitor(ast.NodeVisitor):
     TYPES_FN = [ast.ClassDef, ast.FunctionDef]
     PREVISITORS = set()
     REQUIRED_KEYWORDS = []
+    TYPES = None  # Node types handled by visitor, used to skip subtrees without them
 
     def __init__(self, scanner, *args, **kwargs):
         self.state = {
@@ -33,12 +37,15 @@ class Visitor(ast.NodeVisitor):
             "cf": [],
             "line_start": 0,
             "line_end": 0,
+            "node": None,
+            "flat_index": None,
         }
 
         self.print_method = scanner.print_result
         self.data = scanner.data
         self.log = scanner.log
-        self.required = self.REQUIRED_KEYWORDS
+        self.scanner = scanner
+        self.required = list(self.REQUIRED_KEYWORDS)
 
         # Set arguments
         for arg in self.ARGS:
@@ -54,9 +61,16 @@ class Visitor(ast.NodeVisitor):
 
         self.init_visitor()
 
+        types = self.get_types()
+        self.types_mask = types_mask(types) if types is not None else 0
+
     def init_visitor(self):
         return
 
+    @property
+    def analysis(self):
+        return self.scanner.state["analysis"]
+
     def del_tracked(self, *args):
         for key in args:
             if key in self.state["global"]:
@@ -70,6 +84,27 @@ class Visitor(ast.NodeVisitor):
     def generic_visit(self, node):
         return
 
+    def get_flat_state(self, flat, index):
+        # State as it would be set by visit when reaching the node
+        fn, cf = [], []
+
+        for ii in flat.ancestors(index):
+            node_type = flat.get_type(ii)
+
+            if node_type in self.TYPES_FN:
+                fn.append((flat.get_value(ii), {}))
+            elif node_type in self.TYPES_CF:
+                cf.append((node_type.__name__, {}))
+
+        return {
+            "fn": fn[::-1],
+            "cf": cf[::-1],
+            "line_start": flat.line_start[index],
+            "line_end": flat.line_end[index],
+            "node": None,
+            "flat_index": index,  # Node is looked up by scanner only when needed
+        }
+
     def get_tracked(self, key):
         for scope in ["cf", "fn"]:
             for item in self.state[scope]:
@@ -78,6 +113,21 @@ class Visitor(ast.NodeVisitor):
 
         return self.state["global"].get(key, None)
 
+    def get_types(self):
+        if self.TYPES is not None:
+            return self.TYPES
+
+        # Without generic_visit only nodes with visit_{class} methods are of interest
+        if type(self).generic_visit is Visitor.generic_visit:
+            return self.get_visit_types()
+
+        return None
+
+    def get_visit_types(self):
+        # Methods inherited from ast.NodeVisitor (visit_Constant) don't handle any nodes
+        names = [x for x in dir(self) if x.startswith("visit_") and hasattr(ast, x[6:])]
+        return [getattr(ast, x[6:]) for x in names if getattr(type(self), x) is not getattr(ast.NodeVisitor, x, None)]
+
     def get_tracked_all(self):
         tracked = {
             "global": self.state["global"],
@@ -110,8 +160,11 @@ class Visitor(ast.NodeVisitor):
 
         return value
 
+    def supports_flat(self):
+        return self.FLAT
+
     def print_result(self, msg="", print_source=True):
-        self.print_method(self.state, msg, print_source)
+        self.print_method(self.state, msg, print_source, visitor=self)
 
     @classmethod
     def recursive_attribute_name(cls, node):
@@ -131,6 +184,10 @@ class Visitor(ast.NodeVisitor):
             self.state["cf"][-1][1][key] = value
 
     def visit(self, node):
+        # Skip subtrees without any of the handled node types
+        if self.types_mask and not self.analysis.subtree_types[node] & self.types_mask:
+            return
+
         # Update state
         if type(node) in self.TYPES_FN:
             self.state["fn"].append((node.name, {}))
@@ -139,6 +196,7 @@ class Visitor(ast.NodeVisitor):
 
         self.state["line_start"] = getattr(node, "lineno", self.state["line_start"])
         self.state["line_end"] = getattr(node, "end_lineno", self.state["line_end"])
+        self.state["node"] = node
 
         # Visit node
         method = "visit_" + node.__class__.__name__
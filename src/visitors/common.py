@@ -4,20 +4,11 @@
 # This code is licensed under the MIT license. See LICENSE.md for license terms.
 
 import ast
-import re
 
+from ..matcher import Matcher
 from .base import Visitor
 
 
-# Import astor for pretty dump or fallback to ast (less pretty) dump
-try:
-    import astor
-
-    dump = astor.dump_tree
-except Exception:
-    dump = ast.dump
-
-
 # Visitors for individual AST types
 class VisitorType(Visitor):
     ARGS = ["name"]
@@ -25,16 +16,20 @@ class VisitorType(Visitor):
     PATHS = {}
 
     def init_visitor(self):
-        self.regex = []
+        self.matchers = []
 
         for arg in self.ARGS:
             value = getattr(self, arg, None)
-            self.regex.append((arg, re.compile(f"^{value}$") if value else None))
+            matcher = Matcher(value) if value else None
+            self.matchers.append((arg, matcher))
+
+            if matcher:
+                self.required.append(matcher.keyword())
 
-            if value:
-                self.required.append(re.compile(value.encode()))
+        self.matchers = self.matchers[::-1]
 
-        self.regex = self.regex[::-1]
+    def get_types(self):
+        return [self.TYPE]
 
     def get_name(self, node, arg):
         current_node = node
@@ -49,17 +44,17 @@ class VisitorType(Visitor):
 
         name = ""
 
-        for arg, regex in self.regex:
+        for arg, matcher in self.matchers:
             name = self.get_name(node, arg)
 
             if type(name) is None:
                 return name, False
-            if regex:
+            if matcher:
                 if type(name) is str:
-                    if not regex.match(name):
+                    if not matcher.match(name):
                         return name, False
                 elif type(name) is list:
-                    if not any([regex.match(x) for x in name]):
+                    if not any(map(matcher.match, name)):
                         return name, False
                 else:
                     return name, False
@@ -71,11 +66,23 @@ class VisitorType(Visitor):
         if match:
             self.print_result(name)
 
+    def visit_flat(self, flat):
+        matcher = dict(self.matchers).get("name")
+
+        for index in flat.select(self.TYPE, matcher):
+            self.state.update(self.get_flat_state(flat, index))
+            self.print_result(flat.get_value(index) if self.ARGS else "")
+
+        self.state["fn"], self.state["cf"] = [], []
+
 
 class VisitorTypeNested(VisitorType):
     def generic_visit(self, node):
         return
 
+    def get_types(self):
+        return self.get_visit_types()
+
     def visit_elements(self, elements):
         for element in elements:
             name, match = self.is_match(element)
@@ -90,6 +97,7 @@ class VisitorAssert(VisitorType):
     ARGS = []
     NAME = "assert"
     HELP = "Find all asserts"
+    FLAT = True
     REQUIRED_KEYWORDS = [b"assert"]
     TYPE = ast.Assert
 
@@ -115,21 +123,39 @@ class VisitorCall(VisitorType):
     ARGS = ["name", "path"]
     NAME = "call"
     HELP = "Find all function calls with matching name"
+    FLAT = True
     TYPE = ast.Call
 
+    def init_visitor(self):
+        super().init_visitor()
+        self.chain_node = None
+        self.chain = []
+
+    def get_chain(self, node):
+        # Attribute chain is cached for the last node as it's needed for each argument
+        if node is not self.chain_node:
+            self.chain_node = node
+            self.chain = []
+            node = node.func
+
+            while True:
+                if type(node) is ast.Name:
+                    self.chain.append(node.id)
+                    break
+                elif type(node) is ast.Attribute:
+                    self.chain.append(node.attr)
+                    node = node.value
+                else:
+                    break
+
+        return self.chain
+
+    def supports_flat(self):
+        # Only called name is kept in flattened AST
+        return self.FLAT and self.path is None
+
     def get_name(self, node, name):
-        node = node.func
-        elements = []
-
-        while True:
-            if type(node) is ast.Name:
-                elements.append(node.id)
-                break
-            elif type(node) is ast.Attribute:
-                elements.append(node.attr)
-                node = node.value
-            else:
-                break
+        elements = self.get_chain(node)
 
         if not elements:
             return
@@ -143,6 +169,7 @@ class VisitorCall(VisitorType):
 class VisitorClass(VisitorType):
     NAME = "class"
     HELP = "Find all classes with matching name"
+    FLAT = True
     TYPE = ast.ClassDef
     PATHS = {"name": ["name"]}
     REQUIRED_KEYWORDS = [b"class"]
@@ -151,6 +178,7 @@ class VisitorClass(VisitorType):
 class VisitorConstant(VisitorType):
     NAME = "constant"
     HELP = "Find all constants with matching value"
+    FLAT = True
     TYPE = ast.Constant
     PATHS = {"name": ["value"]}
 
@@ -168,6 +196,7 @@ class VisitorDict(VisitorTypeNested):
 class VisitorFunction(VisitorType):
     NAME = "function"
     HELP = "Find all functions and methods with matching name"
+    FLAT = True
     TYPE = ast.FunctionDef
     PATHS = {"name": ["name"]}
     REQUIRED_KEYWORDS = [b"def"]
@@ -176,6 +205,7 @@ class VisitorFunction(VisitorType):
 class VisitorName(VisitorType):
     NAME = "name"
     HELP = "Find all matching names"
+    FLAT = True
     TYPE = ast.Name
     PATHS = {"name": ["id"]}
 
@@ -193,6 +223,7 @@ class VisitorList(VisitorTypeNested):
 class VisitorParameter(VisitorType):
     NAME = "parameter"
     HELP = "Find function parameters matching names"
+    FLAT = True
     TYPE = ast.arg
     PATHS = {"name": ["arg"]}
 
@@ -202,8 +233,17 @@ class VisitorDump(Visitor):
     NAME = "dump"
     HELP = "Dump AST"
 
+    def init_visitor(self):
+        # Import astor for pretty dump or fallback to ast (less pretty) dump
+        try:
+            import astor
+
+            self.dump = astor.dump_tree
+        except Exception:
+            self.dump = ast.dump
+
     def generic_visit(self, node):
-        print(dump(node))
+        print(self.dump(node))
 
 
 class VisitorPrint(Visitor):
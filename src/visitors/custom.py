@@ -8,8 +8,8 @@
 # A few visitors are provided as an example.
 
 import ast
-import re
 
+from ..matcher import Matcher
 from .base import Visitor
 from . import previsitors
 
@@ -23,12 +23,12 @@ class VisitorForElse(VisitorCustom):
     NAME = "forelse"
     HELP = "Search for `for` loops with `else` clause which seems to always trigger"
     REQUIRED_KEYWORDS = [b"else"]
+    TYPES = [ast.For, ast.While]
 
     def generic_visit(self, node):
-        if type(node) in [ast.For, ast.While] and node.orelse:
-            for x in ast.walk(node):
-                if type(x) in [ast.Break, ast.Return]:
-                    return
+        if type(node) in self.TYPES and node.orelse:
+            if self.analysis.contains(node, [ast.Break, ast.Return]):
+                return
             self.print_result(f"{node.__class__.__name__} with else")
 
 
@@ -56,7 +56,7 @@ class VisitorUnusuedClasses(VisitorCustom):
     ARGS = ["ignore"]
 
     def init_visitor(self):
-        self.ignore = re.compile(f"^({self.ignore})$") if self.ignore else None
+        self.ignore = Matcher(self.ignore) if self.ignore else None
 
     def visit_ClassDef(self, node):
         if "names" not in self.data: